@@ -4,8 +4,12 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
 import json
 import sqlite3
+import zlib
+
+from mempool_db import require_migrated, us_to_iso
 
 
 def main() -> int:
@@ -14,41 +18,42 @@ def main() -> int:
     parser.add_argument("--limit", type=int, default=5)
     args = parser.parse_args()
 
-    conn = sqlite3.connect(args.db)
-    cur = conn.cursor()
-
-    print("api_snapshots (latest)")
-    cur.execute(
-        """
-        SELECT observed_at, endpoint, success, latency_ms, data_json
-        FROM api_snapshots
-        ORDER BY id DESC
-        LIMIT ?
-        """,
-        (args.limit,),
-    )
-    for observed_at, endpoint, success, latency_ms, data_json in cur.fetchall():
-        size = len(data_json) if data_json else 0
-        print(f"{observed_at} {endpoint} success={success} latency_ms={latency_ms} data_len={size}")
-
-    print("\nreplacement_events (latest)")
-    cur.execute(
-        """
-        SELECT observed_at, event_time, old_txid, new_txid, old_fee_sat, new_fee_sat
-        FROM replacement_events
-        ORDER BY id DESC
-        LIMIT ?
-        """,
-        (args.limit,),
-    )
-    rows = cur.fetchall()
-    if not rows:
-        print("(none)")
-    else:
-        for row in rows:
-            print(row)
-
-    conn.close()
+    with contextlib.closing(sqlite3.connect(args.db)) as conn:
+        require_migrated(conn, "api_snapshots")
+        require_migrated(conn, "replacement_events")
+        print("api_snapshots (latest)")
+        snapshots = conn.execute(
+            """
+            SELECT observed_at, endpoint, success, latency_ms, data_json, data_blob
+            FROM api_snapshots
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            (args.limit,),
+        )
+        for observed_at, endpoint, success, latency_ms, data_json, data_blob in snapshots:
+            if data_blob is not None:
+                size = len(zlib.decompress(data_blob))
+            else:
+                size = len(data_json) if data_json else 0
+            print(f"{us_to_iso(observed_at)} {endpoint} success={success} latency_ms={latency_ms} data_len={size}")
+
+        print("\nreplacement_events (latest)")
+        rows = conn.execute(
+            """
+            SELECT observed_at, event_time, old_txid, new_txid, old_fee_sat, new_fee_sat
+            FROM replacement_events
+            ORDER BY id DESC
+            LIMIT ?
+            """,
+            (args.limit,),
+        ).fetchall()
+        if not rows:
+            print("(none)")
+        else:
+            for observed_at, *rest in rows:
+                print((us_to_iso(observed_at), *rest))
+
     return 0
 
 
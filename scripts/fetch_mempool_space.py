@@ -14,19 +14,44 @@ Outputs:
 from __future__ import annotations
 
 import argparse
+import atexit
+import csv
+import io
 import json
 import os
 import sqlite3
 import ssl
+import threading
 import time
-from datetime import datetime, timezone
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
 from urllib.error import HTTPError, URLError
 from urllib.parse import urlparse
-from urllib.request import Request, urlopen
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+from mempool_db import EPOCH, iso_to_us, observed_at_is_text, us_to_iso
+from mempool_http import SSL_CONTEXT, fetch_json
 
 DEFAULT_BASE_URL = "https://mempool.space"
 DEFAULT_OUTDIR = "./data"
 
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",
+    "mmap_size=268435456",
+    # Checkpoints are normally driven by WalCheckpointer; this is only a backstop.
+    "wal_autocheckpoint=10000",
+)
+WAL_CHECKPOINT_INTERVAL = 60.0
+
 ENDPOINTS = {
     "mempool": "/api/mempool",
     "fees": "/api/v1/fees/recommended",
@@ -35,21 +60,66 @@ ENDPOINTS = {
     "replacements": "/api/v1/replacements",
 }
 
+INSERT_SNAPSHOT_SQL = """
+    INSERT INTO api_snapshots (observed_at, endpoint, success, latency_ms, error, data_blob)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
 
-def utc_now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+INSERT_EVENT_SQL = """
+    INSERT INTO replacement_events (
+        observed_at,
+        event_time,
+        old_txid,
+        new_txid,
+        old_fee_sat,
+        old_feerate,
+        old_vsize,
+        new_fee_sat,
+        new_feerate,
+        new_vsize,
+        interval_seconds,
+        full_rbf,
+        mined
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
+COPY_EVENTS_SQL = """
+    COPY replacement_events (
+        observed_at,
+        event_time,
+        old_txid,
+        new_txid,
+        old_fee_sat,
+        old_feerate,
+        old_vsize,
+        new_fee_sat,
+        new_feerate,
+        new_vsize,
+        interval_seconds,
+        full_rbf,
+        mined
+    )
+    FROM STDIN WITH (FORMAT CSV)
+"""
 
-def fetch_json(base_url: str, path: str, timeout: int, context: ssl.SSLContext | None) -> dict | list:
-    url = base_url.rstrip("/") + path
-    req = Request(url, headers={"User-Agent": "mempool-watcher/1.0"})
-    if context:
-        resp = urlopen(req, timeout=timeout, context=context)
-    else:
-        resp = urlopen(req, timeout=timeout)
-    with resp:
-        body = resp.read().decode("utf-8")
-    return json.loads(body)
+
+def utc_now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def us_to_datetime(ts_us: int) -> datetime:
+    return EPOCH + timedelta(microseconds=ts_us)
+
+
+def json_dumps_bytes(obj: object) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            # orjson stops at 255 nesting levels; long replacement chains go through stdlib json.
+            pass
+    return json.dumps(obj, ensure_ascii=True).encode("utf-8")
 
 
 def fetch_json_with_retry(
@@ -59,7 +129,7 @@ def fetch_json_with_retry(
     retries: int,
     backoff_base: float,
     backoff_max: float,
-    context: ssl.SSLContext | None,
+    context: ssl.SSLContext,
 ) -> tuple[dict | list, int]:
     attempt = 0
     while True:
@@ -76,31 +146,121 @@ def fetch_json_with_retry(
             time.sleep(delay)
 
 
-def append_jsonl(path: str, record: dict) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(record, ensure_ascii=True) + "\n")
-
-
-def iter_replacement_edges(node: dict) -> list[dict]:
-    edges: list[dict] = []
-    new_tx = node.get("tx", {})
-    new_time = node.get("time")
-    for repl in node.get("replaces", []) or []:
-        old_tx = repl.get("tx", {})
-        edges.append(
-            {
-                "new_tx": new_tx,
-                "old_tx": old_tx,
-                "new_time": new_time,
-                "old_time": repl.get("time"),
-                "interval": repl.get("interval"),
-                "full_rbf": repl.get("fullRbf"),
-                "mined": repl.get("mined"),
-            }
-        )
-        edges.extend(iter_replacement_edges(repl))
-    return edges
+class JsonlWriter:
+    """Append-only JSONL writer that issues one os.write per file per flush."""
+
+    def __init__(self) -> None:
+        self._fds: dict[str, int] = {}
+        self._pending: dict[str, list[bytes]] = {}
+
+    def write(self, path: str, record: dict) -> None:
+        self._pending.setdefault(path, []).append(json_dumps_bytes(record) + b"\n")
+
+    def flush_all(self) -> None:
+        for path, lines in self._pending.items():
+            if not lines:
+                continue
+            fd = self._fds.get(path)
+            if fd is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                self._fds[path] = fd
+            buf = memoryview(b"".join(lines))
+            while buf:
+                buf = buf[os.write(fd, buf):]
+            lines.clear()
+
+    def close_all(self) -> None:
+        self.flush_all()
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+
+def snapshot_row(
+    observed_at: int,
+    endpoint: str,
+    success: bool,
+    latency_ms: int | None,
+    error: str | None,
+    data: dict | list | None,
+) -> tuple:
+    # Level 1 keeps compression cheap while still shrinking the JSON payloads severalfold.
+    data_blob = zlib.compress(json_dumps_bytes(data), 1) if data is not None else None
+    return (observed_at, endpoint, int(success), latency_ms, error, data_blob)
+
+
+def replacement_event_row(observed_at: int, edge: dict) -> tuple | None:
+    new_tx = edge.get("new_tx", {})
+    old_tx = edge.get("old_tx", {})
+    new_txid = new_tx.get("txid")
+    old_txid = old_tx.get("txid")
+    if not new_txid or not old_txid:
+        return None
+    full_rbf = edge.get("full_rbf")
+    mined = edge.get("mined")
+    return (
+        observed_at,
+        edge.get("new_time"),
+        old_txid,
+        new_txid,
+        old_tx.get("fee"),
+        old_tx.get("rate"),
+        old_tx.get("vsize"),
+        new_tx.get("fee"),
+        new_tx.get("rate"),
+        new_tx.get("vsize"),
+        edge.get("interval"),
+        int(full_rbf) if full_rbf is not None else None,
+        int(mined) if mined is not None else None,
+    )
+
+
+def iter_replacement_edges(root: dict) -> Iterator[dict]:
+    # Explicit stack instead of recursion so long replacement chains cannot hit
+    # the recursion limit; children are pushed reversed to keep pre-order.
+    stack = [(root, repl) for repl in reversed(root.get("replaces") or [])]
+    while stack:
+        node, repl = stack.pop()
+        yield {
+            "new_tx": node.get("tx", {}),
+            "old_tx": repl.get("tx", {}),
+            "new_time": node.get("time"),
+            "old_time": repl.get("time"),
+            "interval": repl.get("interval"),
+            "full_rbf": repl.get("fullRbf"),
+            "mined": repl.get("mined"),
+        }
+        stack.extend((repl, child) for child in reversed(repl.get("replaces") or []))
+
+
+class WalCheckpointer(threading.Thread):
+    """Run PRAGMA wal_checkpoint(PASSIVE) on a separate connection at a fixed interval."""
+
+    def __init__(self, path: str, interval: float) -> None:
+        super().__init__(name="wal-checkpoint", daemon=True)
+        self.path = path
+        self.interval = interval
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        conn = sqlite3.connect(self.path)
+        try:
+            while not self._done.wait(self.interval):
+                try:
+                    conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                except sqlite3.Error as exc:
+                    print(f"wal checkpoint error: {exc}", flush=True)
+        finally:
+            conn.close()
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+
+def _with_datetime(row: tuple) -> tuple:
+    return (us_to_datetime(row[0]),) + row[1:]
 
 
 class DbWriter:
@@ -108,6 +268,7 @@ class DbWriter:
         self.db_url = db_url
         self.kind = "sqlite"
         self.conn = None
+        self._checkpointer: WalCheckpointer | None = None
 
         parsed = urlparse(db_url)
         if parsed.scheme in ("postgres", "postgresql"):
@@ -126,8 +287,13 @@ class DbWriter:
             db_dir = os.path.dirname(path)
             if db_dir:
                 os.makedirs(db_dir, exist_ok=True)
-            self.conn = sqlite3.connect(path)
-            self.conn.execute("PRAGMA journal_mode=WAL;")
+            # Autocommit mode: commit_batch() issues BEGIN/COMMIT itself.
+            self.conn = sqlite3.connect(path, isolation_level=None)
+            for pragma in SQLITE_PRAGMAS:
+                self.conn.execute(f"PRAGMA {pragma}")
+            # Passive checkpoints off the write path keep the WAL bounded without blocking commits.
+            self._checkpointer = WalCheckpointer(path, WAL_CHECKPOINT_INTERVAL)
+            self._checkpointer.start()
         else:
             try:
                 import psycopg2  # type: ignore
@@ -135,21 +301,31 @@ class DbWriter:
                 raise RuntimeError("psycopg2 is required for Postgres support") from exc
             self.conn = psycopg2.connect(db_url)
 
+        placeholder = "%s" if self.kind == "postgres" else "?"
+        self._insert_snapshot_sql = INSERT_SNAPSHOT_SQL.replace("?", placeholder)
+        self._insert_event_sql = INSERT_EVENT_SQL.replace("?", placeholder)
+        self._cursor = self.conn.cursor()
+        self._partitioned = False
+        self._partition_month: tuple[int, int] | None = None
+
         self._ensure_schema()
 
     def _ensure_schema(self) -> None:
         cursor = self.conn.cursor()
         if self.kind == "sqlite":
+            cursor.execute("BEGIN")
+            legacy_tables = self._rename_text_time_tables(cursor)
             cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS api_snapshots (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    observed_at TEXT NOT NULL,
+                    observed_at INTEGER NOT NULL,
                     endpoint TEXT NOT NULL,
                     success INTEGER NOT NULL,
                     latency_ms INTEGER,
                     error TEXT,
-                    data_json TEXT
+                    data_json TEXT,
+                    data_blob BLOB
                 )
                 """
             )
@@ -157,7 +333,7 @@ class DbWriter:
                 """
                 CREATE TABLE IF NOT EXISTS replacement_events (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    observed_at TEXT NOT NULL,
+                    observed_at INTEGER NOT NULL,
                     event_time INTEGER,
                     old_txid TEXT NOT NULL,
                     new_txid TEXT NOT NULL,
@@ -173,29 +349,33 @@ class DbWriter:
                 )
                 """
             )
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_api_snapshots_time ON api_snapshots(observed_at)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_api_snapshots_endpoint ON api_snapshots(endpoint)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_replacement_events_time ON replacement_events(observed_at)")
+            for table in legacy_tables:
+                self._copy_text_time_rows(cursor, table)
+            cursor.execute("PRAGMA table_info(api_snapshots)")
+            if "data_blob" not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE api_snapshots ADD COLUMN data_blob BLOB")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_replacement_events_txids ON replacement_events(old_txid, new_txid)")
         else:
             cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS api_snapshots (
-                    id SERIAL PRIMARY KEY,
-                    observed_at TEXT NOT NULL,
+                    id SERIAL,
+                    observed_at TIMESTAMPTZ NOT NULL,
                     endpoint TEXT NOT NULL,
                     success INTEGER NOT NULL,
                     latency_ms INTEGER,
                     error TEXT,
-                    data_json TEXT
-                )
+                    data_json TEXT,
+                    data_blob BYTEA,
+                    PRIMARY KEY (id, observed_at)
+                ) PARTITION BY RANGE (observed_at)
                 """
             )
             cursor.execute(
                 """
                 CREATE TABLE IF NOT EXISTS replacement_events (
                     id SERIAL PRIMARY KEY,
-                    observed_at TEXT NOT NULL,
+                    observed_at TIMESTAMPTZ NOT NULL,
                     event_time BIGINT,
                     old_txid TEXT NOT NULL,
                     new_txid TEXT NOT NULL,
@@ -211,105 +391,109 @@ class DbWriter:
                 )
                 """
             )
+            cursor.execute("ALTER TABLE api_snapshots ADD COLUMN IF NOT EXISTS data_blob BYTEA")
+            for table in ("api_snapshots", "replacement_events"):
+                cursor.execute(
+                    "SELECT data_type FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'observed_at'",
+                    (table,),
+                )
+                row = cursor.fetchone()
+                if row and row[0] == "text":
+                    cursor.execute(
+                        f"ALTER TABLE {table} ALTER COLUMN observed_at TYPE TIMESTAMPTZ USING observed_at::timestamptz"
+                    )
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_replacement_events_txids ON replacement_events(old_txid, new_txid)")
+            # Tables created before partitioning was introduced stay as plain tables.
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('api_snapshots')")
+            row = cursor.fetchone()
+            self._partitioned = bool(row) and row[0] == "p"
+        self._ensure_time_indexes(cursor)
         self.conn.commit()
 
-    def write_snapshot(
-        self,
-        observed_at: str,
-        endpoint: str,
-        success: bool,
-        latency_ms: int | None,
-        error: str | None,
-        data: dict | list | None,
-    ) -> None:
-        cursor = self.conn.cursor()
-        data_json = json.dumps(data, ensure_ascii=True) if data is not None else None
+    @staticmethod
+    def _ensure_time_indexes(cursor) -> None:
+        # "Latest first" reads walk these indexes forwards; the ascending
+        # variants they replace are dropped.
+        for name in ("idx_api_snapshots_time", "idx_api_snapshots_endpoint", "idx_replacement_events_time"):
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_api_snapshots_time_desc ON api_snapshots(observed_at DESC)")
         cursor.execute(
-            """
-            INSERT INTO api_snapshots (observed_at, endpoint, success, latency_ms, error, data_json)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            if self.kind == "postgres"
-            else """
-            INSERT INTO api_snapshots (observed_at, endpoint, success, latency_ms, error, data_json)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (observed_at, endpoint, int(success), latency_ms, error, data_json),
+            "CREATE INDEX IF NOT EXISTS idx_api_snapshots_endpoint_time_desc ON api_snapshots(endpoint, observed_at DESC)"
         )
-        self.conn.commit()
-
-    def write_replacement_event(
-        self,
-        observed_at: str,
-        event_time: int | None,
-        old_txid: str,
-        new_txid: str,
-        old_fee_sat: float | None,
-        old_feerate: float | None,
-        old_vsize: float | None,
-        new_fee_sat: float | None,
-        new_feerate: float | None,
-        new_vsize: float | None,
-        interval_seconds: int | None,
-        full_rbf: bool | None,
-        mined: bool | None,
-    ) -> None:
-        cursor = self.conn.cursor()
         cursor.execute(
-            """
-            INSERT INTO replacement_events (
-                observed_at,
-                event_time,
-                old_txid,
-                new_txid,
-                old_fee_sat,
-                old_feerate,
-                old_vsize,
-                new_fee_sat,
-                new_feerate,
-                new_vsize,
-                interval_seconds,
-                full_rbf,
-                mined
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            if self.kind == "postgres"
-            else """
-            INSERT INTO replacement_events (
-                observed_at,
-                event_time,
-                old_txid,
-                new_txid,
-                old_fee_sat,
-                old_feerate,
-                old_vsize,
-                new_fee_sat,
-                new_feerate,
-                new_vsize,
-                interval_seconds,
-                full_rbf,
-                mined
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                observed_at,
-                event_time,
-                old_txid,
-                new_txid,
-                old_fee_sat,
-                old_feerate,
-                old_vsize,
-                new_fee_sat,
-                new_feerate,
-                new_vsize,
-                interval_seconds,
-                int(full_rbf) if full_rbf is not None else None,
-                int(mined) if mined is not None else None,
-            ),
+            "CREATE INDEX IF NOT EXISTS idx_replacement_events_time_desc ON replacement_events(observed_at DESC)"
+        )
+
+    def _rename_text_time_tables(self, cursor) -> list[str]:
+        """Move SQLite tables that still store observed_at as ISO text out of the way."""
+        legacy: list[str] = []
+        for table in ("api_snapshots", "replacement_events"):
+            if observed_at_is_text(cursor, table):
+                cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_text_time")
+                legacy.append(table)
+        return legacy
+
+    def _copy_text_time_rows(self, cursor, table: str) -> None:
+        """Copy rows from a renamed legacy table into its new schema, converting observed_at."""
+        self.conn.create_function("iso_to_us", 1, iso_to_us, deterministic=True)
+        cursor.execute(f"PRAGMA table_info({table}_text_time)")
+        columns = [row[1] for row in cursor.fetchall()]
+        select = ", ".join("iso_to_us(observed_at)" if c == "observed_at" else c for c in columns)
+        cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {select} FROM {table}_text_time")
+        cursor.execute(f"DROP TABLE {table}_text_time")
+
+    def ensure_partition(self, observed_at: int) -> None:
+        """Create the monthly api_snapshots partition covering observed_at (Postgres only)."""
+        if not self._partitioned:
+            return
+        dt = us_to_datetime(observed_at)
+        if (dt.year, dt.month) == self._partition_month:
+            return
+        start = datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+        end = datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1, tzinfo=timezone.utc)
+        self._cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS api_snapshots_{dt.year:04d}_{dt.month:02d} "
+            "PARTITION OF api_snapshots FOR VALUES FROM (%s) TO (%s)",
+            (start, end),
         )
         self.conn.commit()
+        self._partition_month = (dt.year, dt.month)
+
+    def commit_batch(self, snapshots: list[tuple], events: list[tuple]) -> None:
+        """Write one poll cycle's rows in a single transaction."""
+        if not snapshots and not events:
+            return
+        cursor = self._cursor
+        try:
+            if self.kind == "sqlite":
+                cursor.execute("BEGIN")
+                cursor.executemany(self._insert_snapshot_sql, snapshots)
+                cursor.executemany(self._insert_event_sql, events)
+                cursor.execute("COMMIT")
+            else:
+                # observed_at is TIMESTAMPTZ on Postgres; rows carry epoch microseconds.
+                cursor.executemany(self._insert_snapshot_sql, [_with_datetime(row) for row in snapshots])
+                if events:
+                    self._copy_events_postgres(cursor, [_with_datetime(row) for row in events])
+                self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def close(self) -> None:
+        if self._checkpointer is not None:
+            self._checkpointer.stop()
+            self._checkpointer = None
+        self.conn.close()
+
+    @staticmethod
+    def _copy_events_postgres(cursor, rows: list[tuple]) -> None:
+        # In CSV format an unquoted empty field is NULL, which is what csv.writer emits for None.
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+        cursor.copy_expert(COPY_EVENTS_SQL, buf)
 
 
 class Metrics:
@@ -356,77 +540,85 @@ def main() -> int:
     out_replacements = os.path.join(args.outdir, "replacements.jsonl")
 
     db_writer = DbWriter(args.db) if args.db else None
+    jsonl_writer = JsonlWriter()
+    atexit.register(jsonl_writer.close_all)
     metrics = Metrics()
 
-    ssl_context = ssl._create_unverified_context() if args.insecure else None
+    ssl_context = ssl._create_unverified_context() if args.insecure else SSL_CONTEXT
+
+    endpoints = {
+        name: path
+        for name, path in ENDPOINTS.items()
+        if not (name == "mempool_blocks" and args.no_mempool_blocks)
+        and not (name == "replacements" and args.no_replacements)
+    }
+    # Requests are I/O bound, so one thread per endpoint turns the per-poll
+    # latency from the sum of the endpoints into the slowest one.
+    executor = ThreadPoolExecutor(max_workers=len(endpoints))
 
     while True:
-        ts = utc_now_iso()
-        for name, path in ENDPOINTS.items():
-            if name == "mempool_blocks" and args.no_mempool_blocks:
-                continue
-            if name == "replacements" and args.no_replacements:
-                continue
+        ts_us = utc_now_us()
+        ts = us_to_iso(ts_us)
+        if db_writer:
+            db_writer.ensure_partition(ts_us)
+        snapshots_to_write: list[tuple] = []
+        events_to_write: list[tuple] = []
+        futures = {
+            executor.submit(
+                fetch_json_with_retry,
+                args.base_url,
+                path,
+                args.timeout,
+                args.retries,
+                args.backoff_base,
+                args.backoff_max,
+                ssl_context,
+            ): name
+            for name, path in endpoints.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
             try:
-                data, latency_ms = fetch_json_with_retry(
-                    args.base_url,
-                    path,
-                    args.timeout,
-                    args.retries,
-                    args.backoff_base,
-                    args.backoff_max,
-                    ssl_context,
-                )
+                data, latency_ms = future.result()
                 if not args.no_jsonl:
                     if name == "mempool":
-                        append_jsonl(out_mempool, {"observed_at": ts, "data": data})
+                        jsonl_writer.write(out_mempool, {"observed_at": ts, "data": data})
                     elif name == "fees":
-                        append_jsonl(out_fees, {"observed_at": ts, "data": data})
+                        jsonl_writer.write(out_fees, {"observed_at": ts, "data": data})
                     elif name == "fees_precise":
-                        append_jsonl(out_fees_precise, {"observed_at": ts, "data": data})
+                        jsonl_writer.write(out_fees_precise, {"observed_at": ts, "data": data})
                     elif name == "replacements":
-                        append_jsonl(out_replacements, {"observed_at": ts, "data": data})
+                        jsonl_writer.write(out_replacements, {"observed_at": ts, "data": data})
                     else:
-                        append_jsonl(out_blocks, {"observed_at": ts, "data": data})
+                        jsonl_writer.write(out_blocks, {"observed_at": ts, "data": data})
                 if db_writer:
-                    db_writer.write_snapshot(ts, name, True, latency_ms, None, data)
+                    snapshots_to_write.append(snapshot_row(ts_us, name, True, latency_ms, None, data))
                     if name == "replacements":
                         for item in data:
                             for edge in iter_replacement_edges(item):
-                                new_tx = edge.get("new_tx", {})
-                                old_tx = edge.get("old_tx", {})
-                                new_txid = new_tx.get("txid")
-                                old_txid = old_tx.get("txid")
-                                if not new_txid or not old_txid:
-                                    continue
-                                db_writer.write_replacement_event(
-                                    observed_at=ts,
-                                    event_time=edge.get("new_time"),
-                                    old_txid=old_txid,
-                                    new_txid=new_txid,
-                                    old_fee_sat=old_tx.get("fee"),
-                                    old_feerate=old_tx.get("rate"),
-                                    old_vsize=old_tx.get("vsize"),
-                                    new_fee_sat=new_tx.get("fee"),
-                                    new_feerate=new_tx.get("rate"),
-                                    new_vsize=new_tx.get("vsize"),
-                                    interval_seconds=edge.get("interval"),
-                                    full_rbf=edge.get("full_rbf"),
-                                    mined=edge.get("mined"),
-                                )
+                                row = replacement_event_row(ts_us, edge)
+                                if row is not None:
+                                    events_to_write.append(row)
                 metrics.record(True, latency_ms)
             except (HTTPError, URLError, json.JSONDecodeError) as exc:
                 if db_writer:
-                    db_writer.write_snapshot(ts, name, False, None, str(exc), None)
+                    snapshots_to_write.append(snapshot_row(ts_us, name, False, None, str(exc), None))
                 metrics.record(False, None)
                 print(f"[{ts}] {name} error: {exc}", flush=True)
 
+        jsonl_writer.flush_all()
+        if db_writer:
+            db_writer.commit_batch(snapshots_to_write, events_to_write)
+
         print(f"[{ts}] {metrics.summary()}", flush=True)
 
         if args.interval <= 0:
             break
         time.sleep(args.interval)
 
+    executor.shutdown()
+    if db_writer:
+        db_writer.close()
     return 0
 
 
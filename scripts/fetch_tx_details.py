@@ -8,28 +8,100 @@ import json
 import os
 import sqlite3
 import ssl
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
 from urllib.error import HTTPError, URLError
-from urllib.request import Request, urlopen
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+from mempool_db import iso_to_us, observed_at_is_text
+from mempool_http import SSL_CONTEXT, fetch_json
 
 DEFAULT_BASE_URL = "https://mempool.space"
+# Txids submitted to the worker pool at a time; bounds pending futures/results.
+CHUNK_SIZE = 500
+# Fetched rows written per transaction.
+BATCH_SIZE = 100
+
+# Both sides of each replacement edge; duplicates are dropped while reading.
+SOURCE_TXIDS_SQL = "SELECT old_txid FROM replacement_events UNION ALL SELECT new_txid FROM replacement_events"
+SOURCE_TXIDS_SINCE_SQL = (
+    "SELECT old_txid FROM replacement_events WHERE observed_at >= ? "
+    "UNION ALL SELECT new_txid FROM replacement_events WHERE observed_at >= ?"
+)
+
+INSERT_TX_SQL = (
+    "INSERT OR REPLACE INTO tx_details (txid, fetched_at, success, status_code, error, data_json) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",
+    "mmap_size=268435456",
+    "wal_autocheckpoint=1000",
+)
 
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def fetch_json(base_url: str, path: str, timeout: int, context: ssl.SSLContext | None) -> dict:
-    url = base_url.rstrip("/") + path
-    req = Request(url, headers={"User-Agent": "mempool-watcher/1.0"})
-    if context:
-        resp = urlopen(req, timeout=timeout, context=context)
-    else:
-        resp = urlopen(req, timeout=timeout)
-    with resp:
-        body = resp.read().decode("utf-8")
-    return json.loads(body)
+def json_dumps(obj: object) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except orjson.JSONEncodeError:
+            # orjson stops at 255 nesting levels; fall back to stdlib json for deeper documents.
+            pass
+    return json.dumps(obj, ensure_ascii=True)
+
+
+class RateLimiter:
+    """Space request starts at least `interval` seconds apart across all worker threads."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait(self) -> None:
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def fetch_tx(
+    base_url: str,
+    txid: str,
+    timeout: int,
+    context: ssl.SSLContext,
+    limiter: RateLimiter,
+) -> tuple[tuple, dict | None]:
+    """Fetch one tx and classify the outcome as a tx_details row (plus the data on success)."""
+    limiter.wait()
+    fetched_at = utc_now_iso()
+    try:
+        data = fetch_json(base_url, f"/api/tx/{txid}", timeout, context)
+    except HTTPError as exc:
+        body = exc.read().decode("utf-8", errors="replace")
+        return (txid, fetched_at, 0, exc.code, body[:1000], None), None
+    except URLError as exc:
+        return (txid, fetched_at, 0, None, str(exc), None), None
+    return (txid, fetched_at, 1, 200, None, json_dumps(data)), data
 
 
 def ensure_schema(conn: sqlite3.Connection) -> None:
@@ -47,6 +119,7 @@ def ensure_schema(conn: sqlite3.Connection) -> None:
         """
     )
     cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_details_fetched_at ON tx_details(fetched_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tx_details_success ON tx_details(success, txid)")
     conn.commit()
 
 
@@ -57,7 +130,10 @@ def main() -> int:
     parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
     parser.add_argument("--outdir", default="./data")
     parser.add_argument("--timeout", type=int, default=15)
-    parser.add_argument("--sleep", type=float, default=0.2, help="Seconds to sleep between requests")
+    parser.add_argument(
+        "--sleep", type=float, default=0.2, help="Minimum seconds between request starts (rate cap across workers)"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent requests in flight")
     parser.add_argument("--limit", type=int, default=0, help="Max txids to fetch (0=all)")
     parser.add_argument("--since", default="", help="ISO time filter on replacement observed_at")
     parser.add_argument("--fetch-all", action="store_true", help="Fetch even if txid already stored")
@@ -66,79 +142,101 @@ def main() -> int:
     args = parser.parse_args()
 
     out_conn = sqlite3.connect(args.db)
+    for pragma in SQLITE_PRAGMAS:
+        out_conn.execute(f"PRAGMA {pragma}")
     ensure_schema(out_conn)
     out_cur = out_conn.cursor()
 
     src_conn = sqlite3.connect(args.source_db)
     src_cur = src_conn.cursor()
 
-    params: list[str] = []
-    since_clause = ""
     if args.since:
-        since_clause = " WHERE observed_at >= ?"
-        params.extend([args.since, args.since])
-
-    query = (
-        "SELECT txid FROM ("
-        "SELECT old_txid AS txid FROM replacement_events" + since_clause + " "
-        "UNION SELECT new_txid AS txid FROM replacement_events" + since_clause +
-        ") WHERE txid IS NOT NULL"
-    )
+        # An integer bound would sort below every legacy TEXT value and match all rows,
+        # so compare as text until the collector has migrated the source DB.
+        if observed_at_is_text(src_conn, "replacement_events"):
+            since: int | str = args.since
+        else:
+            since = iso_to_us(args.since)
+        query, params = SOURCE_TXIDS_SINCE_SQL, (since, since)
+    else:
+        query, params = SOURCE_TXIDS_SQL, ()
 
-    if args.limit and args.limit > 0:
-        query += " LIMIT ?"
-        params.append(str(args.limit))
+    # Txids already stored successfully, loaded once; the same set dedupes the source rows.
+    seen: set[str] = set()
+    if not args.fetch_all:
+        out_cur.execute("SELECT txid FROM tx_details WHERE success = 1")
+        seen.update(row[0] for row in out_cur)
 
+    txids: list[str] = []
     src_cur.execute(query, params)
-    txids = [row[0] for row in src_cur.fetchall()]
-
-    if not args.fetch_all and txids:
-        out_cur.execute("SELECT txid FROM tx_details WHERE success = 1")
-        existing = {row[0] for row in out_cur.fetchall()}
-        txids = [txid for txid in txids if txid not in existing]
+    for (txid,) in src_cur:
+        if txid is None or txid in seen:
+            continue
+        seen.add(txid)
+        txids.append(txid)
+        if args.limit > 0 and len(txids) >= args.limit:
+            break
 
-    ssl_context = ssl._create_unverified_context() if args.insecure else None
+    ssl_context = ssl._create_unverified_context() if args.insecure else SSL_CONTEXT
 
     out_path = os.path.join(args.outdir, "tx_details.jsonl")
     if not args.no_jsonl:
         os.makedirs(args.outdir, exist_ok=True)
 
-    for txid in txids:
-        fetched_at = utc_now_iso()
-        try:
-            data = fetch_json(args.base_url, f"/api/tx/{txid}", args.timeout, ssl_context)
-            out_cur.execute(
-                "INSERT OR REPLACE INTO tx_details (txid, fetched_at, success, status_code, error, data_json) "
-                "VALUES (?, ?, ?, ?, ?, ?)",
-                (txid, fetched_at, 1, 200, None, json.dumps(data, ensure_ascii=True)),
-            )
-            out_conn.commit()
+    rows: list[tuple] = []
+    jsonl_lines: list[str] = []
+
+    def flush() -> None:
+        out_cur.executemany(INSERT_TX_SQL, rows)
+        out_conn.commit()
+        if jsonl_lines:
+            with open(out_path, "a", encoding="utf-8") as f:
+                f.writelines(jsonl_lines)
+        rows.clear()
+        jsonl_lines.clear()
+
+    def record(row: tuple, data: dict | None) -> None:
+        rows.append(row)
+        txid, fetched_at, success, status_code, error, _ = row
+        if success:
             if not args.no_jsonl:
-                with open(out_path, "a", encoding="utf-8") as f:
-                    f.write(json.dumps({"fetched_at": fetched_at, "txid": txid, "data": data}, ensure_ascii=True) + "\n")
+                jsonl_lines.append(json_dumps({"fetched_at": fetched_at, "txid": txid, "data": data}) + "\n")
             print(f"[{fetched_at}] ok {txid}", flush=True)
-        except HTTPError as exc:
-            body = exc.read().decode("utf-8", errors="replace")
-            out_cur.execute(
-                "INSERT OR REPLACE INTO tx_details (txid, fetched_at, success, status_code, error, data_json) "
-                "VALUES (?, ?, ?, ?, ?, ?)",
-                (txid, fetched_at, 0, exc.code, body[:1000], None),
-            )
-            out_conn.commit()
-            print(f"[{fetched_at}] error {txid} status={exc.code}", flush=True)
-        except URLError as exc:
-            out_cur.execute(
-                "INSERT OR REPLACE INTO tx_details (txid, fetched_at, success, status_code, error, data_json) "
-                "VALUES (?, ?, ?, ?, ?, ?)",
-                (txid, fetched_at, 0, None, str(exc), None),
+        elif status_code is not None:
+            print(f"[{fetched_at}] error {txid} status={status_code}", flush=True)
+        else:
+            print(f"[{fetched_at}] error {txid} {error}", flush=True)
+
+    limiter = RateLimiter(args.sleep)
+    executor = ThreadPoolExecutor(max_workers=max(1, args.workers))
+    # Submitted futures whose result has not been recorded yet, in submission order.
+    pending: deque[Future] = deque()
+    try:
+        for i in range(0, len(txids), CHUNK_SIZE):
+            pending.extend(
+                executor.submit(fetch_tx, args.base_url, txid, args.timeout, ssl_context, limiter)
+                for txid in txids[i : i + CHUNK_SIZE]
             )
-            out_conn.commit()
-            print(f"[{fetched_at}] error {txid} {exc}", flush=True)
-
-        if args.sleep > 0:
-            time.sleep(args.sleep)
+            while pending:
+                record(*pending[0].result())
+                pending.popleft()
+                if len(rows) >= BATCH_SIZE:
+                    flush()
+    except BaseException:
+        # Interrupted or failed: drop the queued fetches, let the in-flight ones finish,
+        # and keep every result that did arrive.
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in pending:
+            if not future.cancelled() and future.exception() is None:
+                record(*future.result())
+        raise
+    finally:
+        executor.shutdown()
+        flush()
 
     src_conn.close()
+    # Refresh planner statistics for tx_details only when SQLite deems it worthwhile.
+    out_conn.execute("PRAGMA optimize")
     out_conn.close()
     return 0
 
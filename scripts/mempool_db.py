@@ -0,0 +1,93 @@
+"""observed_at conversions, schema checks and read-only DB access shared by the collector, tx fetcher and plot scripts."""
+
+from __future__ import annotations
+
+import sqlite3
+import sys
+import zlib
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Window plotted when neither --start nor --end is given (and --all is not set).
+DEFAULT_RANGE = timedelta(days=30)
+
+# Read-only analytics: large page cache, memory-mapped I/O, in-memory temp b-trees.
+SQLITE_PRAGMAS = (
+    "query_only=1",
+    "cache_size=-65536",
+    "mmap_size=268435456",
+    "temp_store=MEMORY",
+)
+
+
+def iso_to_us(ts: str) -> int:
+    dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def us_to_iso(ts_us: int) -> str:
+    return (EPOCH + timedelta(microseconds=ts_us)).isoformat()
+
+
+def observed_at_is_text(conn: sqlite3.Connection | sqlite3.Cursor, table: str) -> bool:
+    """True while `table` still stores observed_at as ISO text (fetch_mempool_space.py has not migrated it yet)."""
+    types = {row[1]: row[2].upper() for row in conn.execute(f"PRAGMA table_info({table})")}
+    return types.get("observed_at") == "TEXT"
+
+
+def require_migrated(conn: sqlite3.Connection, table: str) -> None:
+    """Exit if `table` still stores observed_at as ISO text instead of epoch microseconds."""
+    if observed_at_is_text(conn, table):
+        raise SystemExit(
+            f"{table}.observed_at is still ISO text; run fetch_mempool_space.py once against this DB to migrate it."
+        )
+
+
+def parse_iso(ts: str) -> int | None:
+    """Parse a --start/--end value into epoch microseconds; empty means unbounded."""
+    if not ts:
+        return None
+    try:
+        return iso_to_us(ts)
+    except ValueError as exc:
+        raise SystemExit(f"Invalid ISO timestamp: {ts}") from exc
+
+
+def resolve_range(start_arg: str, end_arg: str, all_history: bool) -> tuple[int | None, int | None]:
+    """Turn --start/--end/--all into an observed_at range and log it to stderr."""
+    start = parse_iso(start_arg)
+    end = parse_iso(end_arg)
+    if start is None and end is None and not all_history:
+        start = (datetime.now(timezone.utc) - DEFAULT_RANGE - EPOCH) // timedelta(microseconds=1)
+    print(
+        f"range: {us_to_iso(start) if start is not None else 'start of data'}"
+        f" .. {us_to_iso(end) if end is not None else 'end of data'}",
+        file=sys.stderr,
+        flush=True,
+    )
+    return start, end
+
+
+def inflate(data_blob: bytes | None) -> str | None:
+    """SQL function: decompress a zlib data_blob back into JSON text."""
+    if data_blob is None:
+        return None
+    return zlib.decompress(data_blob).decode("utf-8")
+
+
+def open_ro(path: str) -> sqlite3.Connection:
+    """Open the DB read-only (never creating it) with the analytics pragmas and inflate() registered."""
+    conn = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(f"PRAGMA {pragma}")
+    conn.create_function("inflate", 1, inflate, deterministic=True)
+    return conn
+
+
+def print_query_plan(conn: sqlite3.Connection, query: str, params: list) -> None:
+    """Print SQLite's plan for `query` to stderr (--explain)."""
+    for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params):
+        print(f"plan: {row[-1]}", file=sys.stderr, flush=True)
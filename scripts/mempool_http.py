@@ -0,0 +1,137 @@
+"""Keep-alive HTTP(S) JSON fetching shared by fetch_mempool_space.py and fetch_tx_details.py."""
+
+from __future__ import annotations
+
+import base64
+import http.client
+import io
+import json
+import ssl
+import threading
+from typing import Any
+from urllib.error import HTTPError, URLError
+from urllib.parse import ParseResult, unquote, urljoin, urlparse
+from urllib.request import getproxies, proxy_bypass
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+USER_AGENT = "mempool-watcher/1.0"
+# Redirects are followed like urlopen did, up to this many hops.
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+# Built once and shared by every HTTPS connection; --insecure swaps in an unverified context.
+SSL_CONTEXT = ssl.create_default_context()
+
+# Per-thread keep-alive connections, keyed by (scheme, netloc).
+_local = threading.local()
+
+
+def json_loads(raw: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+class ResumingHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPSConnection that offers its previous TLS session when it reconnects."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._tls_session: ssl.SSLSession | None = None
+
+    def connect(self) -> None:
+        http.client.HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host or self.host
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname, session=self._tls_session)
+
+    def close(self) -> None:
+        if isinstance(self.sock, ssl.SSLSocket) and self.sock.session is not None:
+            self._tls_session = self.sock.session
+        super().close()
+
+
+def _proxy_headers(proxy_url: ParseResult) -> dict[str, str]:
+    """Proxy-Authorization for user:pass@ in the proxy URL, encoded as urllib's ProxyHandler does."""
+    if proxy_url.username is None:
+        return {}
+    credentials = f"{unquote(proxy_url.username)}:{unquote(proxy_url.password or '')}"
+    return {"Proxy-Authorization": "Basic " + base64.b64encode(credentials.encode()).decode("ascii")}
+
+
+def _get_connection(
+    scheme: str, netloc: str, timeout: int, context: ssl.SSLContext
+) -> tuple[http.client.HTTPConnection, dict[str, str] | None]:
+    """Return this thread's keep-alive connection to scheme://netloc, creating it on first use.
+
+    The second item is None for a direct (or CONNECT-tunnelled) connection; for plain http through a
+    proxy it holds the headers to send along with an absolute request URI.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    entry = conns.get((scheme, netloc))
+    if entry is None:
+        target = urlparse(f"{scheme}://{netloc}")
+        proxy = getproxies().get(scheme)
+        proxy_url = forward_headers = None
+        if not proxy or proxy_bypass(target.hostname):
+            host, port = target.hostname, target.port
+        else:
+            proxy_url = urlparse(proxy if "://" in proxy else f"http://{proxy}")
+            host, port = proxy_url.hostname, proxy_url.port
+            if scheme == "http":
+                forward_headers = _proxy_headers(proxy_url)
+        if scheme == "https":
+            conn = ResumingHTTPSConnection(host, port, timeout=timeout, context=context)
+            if proxy_url is not None:
+                conn.set_tunnel(target.hostname, target.port, headers=_proxy_headers(proxy_url))
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        entry = conns[(scheme, netloc)] = (conn, forward_headers)
+    return entry
+
+
+def _get(url: str, timeout: int, context: ssl.SSLContext) -> tuple[http.client.HTTPResponse, bytes]:
+    parsed = urlparse(url)
+    for attempt in range(2):
+        conn, forward_headers = _get_connection(parsed.scheme, parsed.netloc, timeout, context)
+        headers = {"User-Agent": USER_AGENT}
+        if forward_headers is None:
+            target = parsed.path or "/"
+            if parsed.query:
+                target += "?" + parsed.query
+        else:
+            target = url
+            headers.update(forward_headers)
+        reused = conn.sock is not None
+        try:
+            conn.request("GET", target, headers=headers)
+            resp = conn.getresponse()
+            return resp, resp.read()
+        except (http.client.HTTPException, OSError) as exc:
+            conn.close()
+            # The server may have dropped an idle keep-alive connection; retry once on a fresh one.
+            if reused and attempt == 0 and not isinstance(exc, TimeoutError):
+                continue
+            raise URLError(exc) from exc
+    raise AssertionError("unreachable")
+
+
+def fetch_json(base_url: str, path: str, timeout: int, context: ssl.SSLContext) -> dict | list:
+    """GET base_url + path as JSON; raises HTTPError for non-2xx and URLError for transport failures."""
+    url = base_url.rstrip("/") + path
+    for _ in range(MAX_REDIRECTS + 1):
+        resp, body = _get(url, timeout, context)
+        location = resp.getheader("Location")
+        if resp.status not in REDIRECT_CODES or not location:
+            break
+        url = urljoin(url, location)
+    else:
+        raise HTTPError(url, resp.status, "too many redirects", resp.headers, io.BytesIO(body))
+    if not 200 <= resp.status < 300:
+        raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(body))
+    return json_loads(body)
@@ -4,29 +4,58 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
 import json
-import sqlite3
-from datetime import datetime
-
-import matplotlib.pyplot as plt
-
-
-def parse_iso(ts: str) -> str:
-    if not ts:
-        return ""
-    try:
-        datetime.fromisoformat(ts.replace("Z", "+00:00"))
-    except ValueError as exc:
-        raise SystemExit(f"Invalid ISO timestamp: {ts}") from exc
-    return ts
+from typing import Any
+
+import matplotlib
+import numpy as np
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+try:
+    import orjson  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+from mempool_db import open_ro, print_query_plan, require_migrated, resolve_range, us_to_iso  # noqa: E402
+
+
+def json_loads(raw: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def downsample_minmax(x: np.ndarray, y: np.ndarray, max_points: int) -> tuple[np.ndarray, np.ndarray]:
+    """Keep the end points plus the min and max y of each of ~max_points / 2 equal-size bins."""
+    n = len(x)
+    if max_points <= 0 or n <= max_points:
+        return x, y
+    inner = y[1:-1]
+    size = -(-len(inner) // max(1, (max_points - 2) // 2))
+    n_bins = -(-len(inner) // size)
+    pad = n_bins * size - len(inner)
+    lows = np.pad(inner, (0, pad), constant_values=np.inf).reshape(n_bins, size)
+    highs = np.pad(inner, (0, pad), constant_values=-np.inf).reshape(n_bins, size)
+    offsets = np.arange(n_bins) * size + 1
+    keep = np.unique(
+        np.concatenate(([0, n - 1], offsets + lows.argmin(axis=1), offsets + highs.argmax(axis=1)))
+    )
+    return x[keep], y[keep]
 
 
-def main() -> int:
+def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Plot mempool fee histogram.")
     parser.add_argument("--db", required=True, help="Path to SQLite DB (e.g. ./data/mempool.db)")
     parser.add_argument("--out", required=True, help="Output PNG path")
     parser.add_argument("--start", default="", help="ISO start time (inclusive)")
     parser.add_argument("--end", default="", help="ISO end time (inclusive)")
+    parser.add_argument(
+        "--all", action="store_true", help="Use the full history when no --start/--end is given (default: last 30 days)"
+    )
+    parser.add_argument("--explain", action="store_true", help="Print the SQLite query plan to stderr")
     parser.add_argument("--log-x", action="store_true", help="Use log scale for fee rate")
     parser.add_argument("--log-y", action="store_true", help="Use log scale for vsize")
     parser.add_argument(
@@ -35,77 +64,89 @@ def main() -> int:
         choices=["step", "bar"],
         help="Plot style using fee_rate as x (step area or bars).",
     )
-    args = parser.parse_args()
-
-    start = parse_iso(args.start)
-    end = parse_iso(args.end)
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=2000,
+        help="Min/max-downsample the histogram to at most this many points before plotting (0=off)",
+    )
+    args = parser.parse_args(argv)
+    # The end points plus one bin's min and max already take 4 points.
+    if args.max_points < 0 or 0 < args.max_points < 4:
+        parser.error("--max-points must be 0 (off) or at least 4")
 
-    conn = sqlite3.connect(args.db)
-    cur = conn.cursor()
+    start, end = resolve_range(args.start, args.end, args.all)
 
+    # Only the fee_histogram array crosses into Python; SQLite extracts it from the payload.
     query = """
-        SELECT observed_at, data_json
+        SELECT observed_at, json_extract(COALESCE(inflate(data_blob), data_json), '$.fee_histogram')
         FROM api_snapshots
-        WHERE endpoint = 'mempool'
+        WHERE endpoint = 'mempool' AND success = 1
     """
-    params: list[str] = []
-    if start:
+    params: list[int] = []
+    if start is not None:
         query += " AND observed_at >= ?"
         params.append(start)
-    if end:
+    if end is not None:
         query += " AND observed_at <= ?"
         params.append(end)
-    query += " ORDER BY id DESC LIMIT 1"
+    # Seeks idx_api_snapshots_endpoint_time_desc instead of scanning by id.
+    query += " ORDER BY observed_at DESC LIMIT 1"
 
-    cur.execute(query, params)
-    row = cur.fetchone()
-    conn.close()
+    with contextlib.closing(open_ro(args.db)) as conn:
+        require_migrated(conn, "api_snapshots")
+        if args.explain:
+            print_query_plan(conn, query, params)
+        row = conn.execute(query, params).fetchone()
 
     if not row:
         raise SystemExit("No mempool snapshots found for the selected range.")
 
-    observed_at, data_json = row
-    data = json.loads(data_json)
-    histogram = data.get("fee_histogram") or []
+    observed_at, histogram_json = row
+    histogram = json_loads(histogram_json) if histogram_json else []
     if not histogram:
         raise SystemExit("fee_histogram missing in snapshot.")
 
-    sorted_pairs = sorted((bucket[0], bucket[1]) for bucket in histogram)
-    fees = [p[0] for p in sorted_pairs]
-    vsizes = [p[1] for p in sorted_pairs]
-
-    min_fee = min(fees) if fees else 0
-    max_fee = max(fees) if fees else 0
-
-    plt.figure(figsize=(12, 6))
-    if args.style == "bar":
-        widths: list[float] = []
-        if len(fees) > 1:
-            for i, fee in enumerate(fees):
-                left = fees[i - 1] if i > 0 else None
-                right = fees[i + 1] if i < len(fees) - 1 else None
-                if left is None:
-                    width = (right - fee) * 0.9
-                elif right is None:
-                    width = (fee - left) * 0.9
-                else:
-                    width = (right - left) * 0.45
-                widths.append(max(width, 0.0001))
+    # Sort by fee rate (vsize breaks ties) in one pass over the (n, 2) array.
+    pairs = np.asarray(histogram, dtype=float)
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    fees = pairs[:, 0]
+    vsizes = pairs[:, 1]
+
+    min_fee = fees[0]
+    max_fee = fees[-1]
+    fees, vsizes = downsample_minmax(fees, vsizes, args.max_points)
+    # Title stats above use full precision; float32 is plenty for drawing.
+    fees = fees.astype(np.float32)
+    vsizes = vsizes.astype(np.float32)
+
+    fig = plt.figure(figsize=(12, 6), constrained_layout=True)
+    try:
+        if args.style == "bar":
+            if len(fees) > 1:
+                # Half the gap to each neighbour; the edge bars use 0.9 of their single gap.
+                widths = np.empty_like(fees)
+                widths[1:-1] = 0.45 * (fees[2:] - fees[:-2])
+                widths[0] = 0.9 * (fees[1] - fees[0])
+                widths[-1] = 0.9 * (fees[-1] - fees[-2])
+                np.maximum(widths, 0.0001, out=widths)
+            else:
+                widths = np.array([0.1])
+            plt.bar(fees, vsizes, width=widths, align="center", color="#4B5F8A", alpha=0.7)
         else:
-            widths = [0.1]
-        plt.bar(fees, vsizes, width=widths, align="center", color="#4B5F8A", alpha=0.7)
-    else:
-        plt.step(fees, vsizes, where="mid", color="#4B5F8A", linewidth=1.5)
-        plt.fill_between(fees, vsizes, step="mid", color="#4B5F8A", alpha=0.25)
-    plt.xlabel("fee rate (sat/vB)")
-    plt.ylabel("vsize")
-    plt.title(f"fee_histogram @ {observed_at} (min={min_fee:.3g}, max={max_fee:.3g})")
-    if args.log_x:
-        plt.xscale("log")
-    if args.log_y:
-        plt.yscale("log")
-    plt.tight_layout()
-    plt.savefig(args.out, dpi=150)
+            # Rasterized so dense histograms stay a bitmap even when --out is .svg/.pdf.
+            plt.step(fees, vsizes, where="mid", color="#4B5F8A", linewidth=1.5, rasterized=True)
+            plt.fill_between(fees, vsizes, step="mid", color="#4B5F8A", alpha=0.25, rasterized=True)
+        plt.xlabel("fee rate (sat/vB)")
+        plt.ylabel("vsize")
+        plt.title(f"fee_histogram @ {us_to_iso(observed_at)} (min={min_fee:.3g}, max={max_fee:.3g})")
+        if args.log_x:
+            plt.xscale("log")
+        if args.log_y:
+            plt.yscale("log")
+        fig.savefig(args.out, dpi=150)
+    finally:
+        plt.close(fig)
 
     return 0
 
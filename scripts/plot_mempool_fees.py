@@ -4,116 +4,117 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
 import csv
-import json
-import sqlite3
-from collections import defaultdict
-from datetime import datetime, timezone
 
-import matplotlib.pyplot as plt
+import matplotlib
+import numpy as np
 
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
 
-def parse_iso(ts: str) -> str:
-    if not ts:
-        return ""
-    try:
-        datetime.fromisoformat(ts.replace("Z", "+00:00"))
-    except ValueError as exc:
-        raise SystemExit(f"Invalid ISO timestamp: {ts}") from exc
-    return ts
+from mempool_db import open_ro, print_query_plan, require_migrated, resolve_range  # noqa: E402
 
 
-def bucket_ts(iso_ts: str, bucket: str) -> str:
-    dt = datetime.fromisoformat(iso_ts.replace("Z", "+00:00"))
-    if bucket == "hour":
-        dt = dt.replace(minute=0, second=0, microsecond=0)
-    elif bucket == "day":
-        dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-    else:
-        raise SystemExit("bucket must be 'hour' or 'day'")
-    return dt.astimezone(timezone.utc).isoformat()
+# strftime label and width (in microseconds) of each bucket size.
+BUCKETS = {
+    "hour": ("%Y-%m-%dT%H:00:00+00:00", 3600 * 1_000_000),
+    "day": ("%Y-%m-%dT00:00:00+00:00", 86400 * 1_000_000),
+}
 
 
-def main() -> int:
+def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Plot mempool vsize and recommended fees.")
     parser.add_argument("--db", required=True, help="Path to SQLite DB (e.g. ./data/mempool.db)")
     parser.add_argument("--out", required=True, help="Output PNG path")
     parser.add_argument("--csv-out", default="", help="Optional CSV export path")
     parser.add_argument("--start", default="", help="ISO start time (inclusive)")
     parser.add_argument("--end", default="", help="ISO end time (inclusive)")
+    parser.add_argument(
+        "--all", action="store_true", help="Use the full history when no --start/--end is given (default: last 30 days)"
+    )
+    parser.add_argument("--explain", action="store_true", help="Print the SQLite query plan to stderr")
     parser.add_argument("--bucket", default="hour", choices=["hour", "day"])
-    args = parser.parse_args()
-
-    start = parse_iso(args.start)
-    end = parse_iso(args.end)
+    args = parser.parse_args(argv)
 
-    conn = sqlite3.connect(args.db)
-    cur = conn.cursor()
+    start, end = resolve_range(args.start, args.end, args.all)
 
-    query = """
-        SELECT observed_at, endpoint, data_json
-        FROM api_snapshots
-        WHERE endpoint IN ('mempool', 'fees_precise')
-    """
-    params: list[str] = []
-    if start:
-        query += " AND observed_at >= ?"
+    # Pick the last successful snapshot per endpoint and bucket from the
+    # (endpoint, observed_at) index, then decode only those payloads.
+    range_clause = ""
+    params: list[int | str] = []
+    if start is not None:
+        range_clause += " AND observed_at >= ?"
         params.append(start)
-    if end:
-        query += " AND observed_at <= ?"
+    if end is not None:
+        range_clause += " AND observed_at <= ?"
         params.append(end)
-    query += " ORDER BY observed_at ASC"
-
-    cur.execute(query, params)
-
-    buckets: dict[str, dict[str, float | None]] = defaultdict(lambda: {
-        "vsize": None,
-        "fastestFee": None,
-    })
-
-    for observed_at, endpoint, data_json in cur.fetchall():
-        if not data_json:
-            continue
-        data = json.loads(data_json)
-        b = bucket_ts(observed_at, args.bucket)
-        if endpoint == "mempool":
-            buckets[b]["vsize"] = data.get("vsize")
-        elif endpoint == "fees_precise":
-            if "fastestFee" in data:
-                buckets[b]["fastestFee"] = data.get("fastestFee")
-
-    conn.close()
+    label_format, width_us = BUCKETS[args.bucket]
+    params = [*params, width_us, label_format]
+    query = f"""
+        WITH latest AS (
+            SELECT endpoint, MAX(observed_at) AS observed_at
+            FROM api_snapshots
+            WHERE endpoint IN ('mempool', 'fees_precise') AND success = 1{range_clause}
+            GROUP BY endpoint, observed_at / ?
+        )
+        SELECT
+            strftime(?, s.observed_at / 1000000, 'unixepoch') AS bucket,
+            MAX(CASE WHEN s.endpoint = 'mempool'
+                THEN json_extract(COALESCE(inflate(s.data_blob), s.data_json), '$.vsize') END),
+            MAX(CASE WHEN s.endpoint = 'fees_precise'
+                THEN json_extract(COALESCE(inflate(s.data_blob), s.data_json), '$.fastestFee') END)
+        FROM latest
+        JOIN api_snapshots AS s ON s.endpoint = latest.endpoint AND s.observed_at = latest.observed_at
+        GROUP BY bucket
+        ORDER BY bucket
+    """
 
-    if not buckets:
+    xs: list[str] = []
+    vsize: list[float] = []
+    fastest: list[float] = []
+    with contextlib.closing(open_ro(args.db)) as conn:
+        require_migrated(conn, "api_snapshots")
+        if args.explain:
+            print_query_plan(conn, query, params)
+        for bucket, bucket_vsize, bucket_fastest in conn.execute(query, params):
+            xs.append(bucket)
+            vsize.append(bucket_vsize or 0)
+            fastest.append(bucket_fastest or 0)
+
+    if not xs:
         raise SystemExit("No mempool/fees snapshots found for the selected range.")
 
-    xs = sorted(buckets.keys())
-    vsize = [buckets[x]["vsize"] or 0 for x in xs]
-    fastest = [buckets[x]["fastestFee"] or 0 for x in xs]
-
     if args.csv_out:
         with open(args.csv_out, "w", newline="", encoding="utf-8") as f:
             writer = csv.writer(f)
             writer.writerow(["bucket", "vsize", "fastestFee"])
-            for row in zip(xs, vsize, fastest):
-                writer.writerow(row)
+            writer.writerows(zip(xs, vsize, fastest))
 
-    plt.figure(figsize=(12, 7))
-    ax1 = plt.gca()
-    ax1.plot(xs, vsize, color="#4B714D", label="mempool vsize")
-    ax1.set_ylabel("vsize")
-    ax1.tick_params(axis='x', rotation=45)
+    vsize_f = np.asarray(vsize, dtype=np.float32)
+    fastest_f = np.asarray(fastest, dtype=np.float32)
+    # Parse the UTC bucket labels once; matplotlib then plots a real date axis.
+    times = np.array([x[:19] for x in xs], dtype="datetime64[s]")
 
-    ax2 = ax1.twinx()
-    ax2.plot(xs, fastest, color="#8A6B4B", label="fastestFee")
-    ax2.set_ylabel("recommended fee")
-
-    lines, labels = ax1.get_legend_handles_labels()
-    lines2, labels2 = ax2.get_legend_handles_labels()
-    ax1.legend(lines + lines2, labels + labels2, loc="upper left")
-
-    plt.tight_layout()
-    plt.savefig(args.out, dpi=150)
+    fig = plt.figure(figsize=(12, 7), constrained_layout=True)
+    try:
+        ax1 = plt.gca()
+        ax1.plot(times, vsize_f, color="#4B714D", label="mempool vsize")
+        ax1.xaxis_date()
+        ax1.set_ylabel("vsize")
+        ax1.tick_params(axis='x', rotation=45)
+
+        ax2 = ax1.twinx()
+        ax2.plot(times, fastest_f, color="#8A6B4B", label="fastestFee")
+        ax2.set_ylabel("recommended fee")
+
+        lines, labels = ax1.get_legend_handles_labels()
+        lines2, labels2 = ax2.get_legend_handles_labels()
+        ax1.legend(lines + lines2, labels + labels2, loc="upper left")
+
+        fig.savefig(args.out, dpi=150)
+    finally:
+        plt.close(fig)
 
     return 0
 
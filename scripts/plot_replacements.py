@@ -4,97 +4,92 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
 import csv
-import sqlite3
-from collections import defaultdict
-from datetime import datetime, timezone
 
-import matplotlib.pyplot as plt
+import matplotlib
+import numpy as np
 
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
 
-def parse_iso(ts: str) -> str:
-    if not ts:
-        return ""
-    try:
-        datetime.fromisoformat(ts.replace("Z", "+00:00"))
-    except ValueError as exc:
-        raise SystemExit(f"Invalid ISO timestamp: {ts}") from exc
-    return ts
+from mempool_db import open_ro, print_query_plan, require_migrated, resolve_range  # noqa: E402
 
 
-def bucket_ts(iso_ts: str, bucket: str) -> str:
-    dt = datetime.fromisoformat(iso_ts.replace("Z", "+00:00"))
-    if bucket == "hour":
-        dt = dt.replace(minute=0, second=0, microsecond=0)
-    elif bucket == "day":
-        dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-    else:
-        raise SystemExit("bucket must be 'hour' or 'day'")
-    return dt.astimezone(timezone.utc).isoformat()
+# strftime label of each bucket size; observed_at is divided down to seconds first.
+BUCKET_FORMATS = {
+    "hour": "%Y-%m-%dT%H:00:00+00:00",
+    "day": "%Y-%m-%dT00:00:00+00:00",
+}
 
 
-def main() -> int:
+def main(argv: list[str] | None = None) -> int:
     parser = argparse.ArgumentParser(description="Plot replacement event metrics.")
     parser.add_argument("--db", required=True, help="Path to SQLite DB (e.g. ./data/mempool.db)")
     parser.add_argument("--out", required=True, help="Output PNG path")
     parser.add_argument("--csv-out", default="", help="Optional CSV export path")
     parser.add_argument("--start", default="", help="ISO start time (inclusive)")
     parser.add_argument("--end", default="", help="ISO end time (inclusive)")
+    parser.add_argument(
+        "--all", action="store_true", help="Use the full history when no --start/--end is given (default: last 30 days)"
+    )
+    parser.add_argument("--explain", action="store_true", help="Print the SQLite query plan to stderr")
     parser.add_argument("--bucket", default="hour", choices=["hour", "day"])
-    args = parser.parse_args()
-
-    start = parse_iso(args.start)
-    end = parse_iso(args.end)
+    args = parser.parse_args(argv)
 
-    conn = sqlite3.connect(args.db)
-    cur = conn.cursor()
+    start, end = resolve_range(args.start, args.end, args.all)
 
+    # Bucket and count in SQLite; the range filter is served by idx_replacement_events_time_desc.
     query = """
-        SELECT observed_at
+        SELECT strftime(?, observed_at / 1000000, 'unixepoch') AS bucket, COUNT(*)
         FROM replacement_events
         WHERE 1=1
     """
-    params: list[str] = []
-    if start:
+    params: list[int | str] = [BUCKET_FORMATS[args.bucket]]
+    if start is not None:
         query += " AND observed_at >= ?"
         params.append(start)
-    if end:
+    if end is not None:
         query += " AND observed_at <= ?"
         params.append(end)
-    query += " ORDER BY observed_at ASC"
-
-    cur.execute(query, params)
-
-    buckets: dict[str, dict[str, float]] = defaultdict(lambda: {"count": 0})
-
-    for (observed_at,) in cur.fetchall():
-        b = bucket_ts(observed_at, args.bucket)
-        buckets[b]["count"] += 1
-
-    conn.close()
-
-    if not buckets:
+    query += " GROUP BY bucket ORDER BY bucket"
+
+    xs: list[str] = []
+    counts: list[int] = []
+    with contextlib.closing(open_ro(args.db)) as conn:
+        require_migrated(conn, "replacement_events")
+        if args.explain:
+            print_query_plan(conn, query, params)
+        for bucket, count in conn.execute(query, params):
+            xs.append(bucket)
+            counts.append(count)
+
+    if not xs:
         raise SystemExit("No replacement_events found for the selected range.")
 
-    xs = sorted(buckets.keys())
-    counts = [buckets[x]["count"] for x in xs]
-
     if args.csv_out:
         with open(args.csv_out, "w", newline="", encoding="utf-8") as f:
             writer = csv.writer(f)
             writer.writerow(["bucket", "count"])
-            for x, c in zip(xs, counts):
-                writer.writerow([x, c])
-
-    plt.figure(figsize=(12, 7))
-    ax = plt.gca()
-    ax.bar(xs, counts, color="#4B714D", alpha=0.6, label="replacement count")
-    ax.set_ylabel("count")
-    ax.tick_params(axis='x', rotation=45)
-    ax.legend(loc="upper left")
-
-    plt.tight_layout()
-    plt.savefig(args.out, dpi=150)
+            writer.writerows(zip(xs, counts))
+
+    counts_f = np.asarray(counts, dtype=np.float32)
+    # Parse the UTC bucket labels once; matplotlib then plots a real date axis.
+    times = np.array([x[:19] for x in xs], dtype="datetime64[s]")
+    bar_width = 0.8 / 24 if args.bucket == "hour" else 0.8
+
+    fig = plt.figure(figsize=(12, 7), constrained_layout=True)
+    try:
+        ax = plt.gca()
+        ax.bar(times, counts_f, width=bar_width, align="edge", color="#4B714D", alpha=0.6, label="replacement count")
+        ax.xaxis_date()
+        ax.set_ylabel("count")
+        ax.tick_params(axis='x', rotation=45)
+        ax.legend(loc="upper left")
+
+        fig.savefig(args.out, dpi=150)
+    finally:
+        plt.close(fig)
 
     return 0
 
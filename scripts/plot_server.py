@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Long-lived plot worker: render many charts while paying matplotlib/numpy imports once."""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socketserver
+import stat
+import sys
+from typing import IO
+
+import plot_fee_histogram
+import plot_mempool_fees
+import plot_replacements
+
+SCRIPTS = {
+    "plot_fee_histogram": plot_fee_histogram.main,
+    "plot_mempool_fees": plot_mempool_fees.main,
+    "plot_replacements": plot_replacements.main,
+}
+
+
+def run_command(line: str) -> dict:
+    """Run one {"script": ..., "args": [...]} command and describe the outcome."""
+    try:
+        command = json.loads(line)
+        main = SCRIPTS[command["script"]]
+        args = command.get("args", [])
+        if not isinstance(args, list):
+            raise TypeError("args must be a list")
+    except (ValueError, KeyError, TypeError, AttributeError) as exc:
+        return {"ok": False, "error": f"bad command: {exc}"}
+
+    try:
+        # stdout carries the replies; anything a script prints (e.g. --help) goes to stderr.
+        with contextlib.redirect_stdout(sys.stderr):
+            code = main([str(arg) for arg in args])
+    except SystemExit as exc:
+        # The plot scripts report errors (and argparse usage errors) through SystemExit.
+        if exc.code in (None, 0):
+            return {"ok": True}
+        error = exc.code if isinstance(exc.code, str) else f"exit status {exc.code}"
+        return {"ok": False, "error": error}
+    except Exception as exc:
+        return {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+    return {"ok": code == 0}
+
+
+def serve(inp: IO[str], out: IO[str]) -> None:
+    for line in inp:
+        if not line.strip():
+            continue
+        out.write(json.dumps(run_command(line)) + "\n")
+        out.flush()
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """Serve newline-delimited commands from one socket client."""
+
+    def handle(self) -> None:
+        serve(
+            io.TextIOWrapper(self.rfile, encoding="utf-8"),
+            io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True),
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run plot scripts from JSON commands (one per line).")
+    parser.add_argument("--socket", default="", help="Listen on this Unix socket instead of stdin/stdout")
+    args = parser.parse_args()
+
+    if not args.socket:
+        serve(sys.stdin, sys.stdout)
+        return 0
+
+    # Only clear a stale socket left by a previous run; never delete some other file at that path.
+    try:
+        mode = os.lstat(args.socket).st_mode
+    except FileNotFoundError:
+        pass
+    else:
+        if not stat.S_ISSOCK(mode):
+            raise SystemExit(f"{args.socket} exists and is not a socket")
+        os.unlink(args.socket)
+    # Clients are served one at a time; pyplot state is not thread-safe.
+    with socketserver.UnixStreamServer(args.socket, CommandHandler) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())